@@ -1,11 +1,13 @@
+import asyncio
 import os
 import sys
 import dataclasses
+import heapq
 import platform
 from collections import defaultdict
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 from telegram.client import Telegram
 
@@ -21,7 +23,7 @@ class TgException(Exception):
     ...
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(eq=False)
 class TgVideo:
     caption: Optional[str]
     duration: timedelta
@@ -32,11 +34,27 @@ class TgVideo:
     album: Optional[list]
     local_path: Optional[str] = None
     source_group: Optional[str] = None
+    duration_str: str = dataclasses.field(init=False, repr=False)
+    size_str: str = dataclasses.field(init=False, repr=False)
+    _short_caption: Optional[str] = dataclasses.field(
+        default=None, init=False, repr=False, compare=False,
+    )
+
+    def __post_init__(self) -> None:
+        self.duration_str = f'{self.duration // 60:02}:{self.duration % 60:02}'
+        self.size_str = f'{self.expected_size >> 20}mb'
 
     @property
     def completed(self) -> bool:
         return self.expected_size == self.downloaded_size
 
+    @property
+    def short_caption(self) -> str:
+        if self._short_caption is None:
+            caption = self.caption or ''
+            self._short_caption = caption.partition('\n')[0].rstrip('\r')
+        return self._short_caption
+
 
 class TgClient:
     def __init__(self) -> None:
@@ -50,41 +68,41 @@ class TgClient:
             files_directory='/data/data/com.termux/files/home/storage/downloads/Telegram/.tg',
             library_path=path if arch == 'aarch64' else None,
         )
+        self._get_chats = self._client.get_chats
+        self._get_chat_history = self._client.get_chat_history
         self._client.add_update_handler('updateFile', self._update_file_handler)
-        self._download_callbacks = []
+        self._download_callbacks = set()
         self._videos = {}
+        self._videos_list = None
+        self._gen = 0
+        self._last_message_id = None
         self._loading = {}
+        self._loading_by_file_id = {}
+        self._free_priorities = list(range(2, 33))
 
-    def init(self) -> None:
+    async def init(self) -> None:
         try:
             self._client.login()
         except Exception as e:
             raise TgException(f'cant login: {e}')
 
-        self._call_wrap('get_chats')
+        await self._wait('get_chats', self._get_chats())
 
-    def _call(self, method: str, **params) -> dict:
-        result = self._client.call_method(method, params)
-        result.wait()
+    async def _wait(self, method: str, result) -> dict:
+        await asyncio.get_running_loop().run_in_executor(None, result.wait)
         if result.error:
             raise TgException(f'cant {method}: {result.error_info}')
 
         return result.update
 
-    def _call_wrap(self, method: str, *args, **kwargs):
-        result = getattr(self._client, method)(*args, **kwargs)
-        result.wait()
-        if result.error:
-            raise TgException(f'cant wrap {method}: {result.error_info}')
-
-        return result.update
+    async def _call(self, method: str, **params) -> dict:
+        return await self._wait(method, self._client.call_method(method, params))
 
     def add_download_callback(self, callback) -> None:
-        self._download_callbacks.append(callback)
+        self._download_callbacks.add(callback)
 
     def remove_download_callback(self, callback) -> None:
-        if callback in self._download_callbacks:
-            self._download_callbacks.remove(callback)
+        self._download_callbacks.discard(callback)
 
     def _update_file_handler(self, event: dict) -> None:
         event_file = event['file']
@@ -99,12 +117,17 @@ class TgClient:
         if video.completed:
             self._remove_from_queue(video)
 
-        for cb in self._download_callbacks:
+        for cb in tuple(self._download_callbacks):
             cb(video)
 
-    def _fetch_page(self, limit: int = 100, last_message_id: int = None) -> dict[int, TgVideo]:
-        result = self._call_wrap('get_chat_history', chat_id, limit=limit, from_message_id=last_message_id)
+    async def _fetch_page(self, limit: int = 100, last_message_id: int = None) -> dict[int, TgVideo]:
+        result = await self._wait(
+            'get_chat_history',
+            self._get_chat_history(chat_id, limit=limit, from_message_id=last_message_id),
+        )
         messages = result['messages']
+        if messages:
+            self._last_message_id = messages[-1]['id']
 
         videos = {}
         albums = defaultdict(list)
@@ -136,53 +159,78 @@ class TgClient:
 
         return videos
 
-    def list_videos(self, limit: int = 100) -> list[TgVideo]:
-        self._videos = self._fetch_page(limit)
+    async def list_videos(self, limit: int = 100) -> list[TgVideo]:
+        self._last_message_id = None
+        self._videos = await self._fetch_page(limit)
+        self._videos_list = None
+        self._gen += 1
         return self.videos
 
-    def load_next(self, limit: int = 10) -> None:
-        if not self.videos:
-            self.list_videos()
-            return
+    async def load_next(self, limit: int = 10) -> bool:
+        if self._last_message_id is None:
+            await self.list_videos()
+            return self._last_message_id is not None
+
+        last_message_id = self._last_message_id
+        self._videos.update(await self._fetch_page(limit, last_message_id))
+        self._videos_list = None
+        self._gen += 1
+        # the cursor only stays put once the history is exhausted
+        return self._last_message_id != last_message_id
 
-        last_message_id = self.videos[-1].message_id
-        page = self._fetch_page(limit, last_message_id)
-        self._videos = {**self._videos, **page}
+    def __len__(self) -> int:
+        return len(self._videos)
+
+    def iter_videos(self) -> Iterable[TgVideo]:
+        return self._videos.values()
+
+    @property
+    def generation(self) -> int:
+        return self._gen
 
     @property
     def videos(self) -> list[TgVideo]:
-        return list(self._videos.values())
+        if self._videos_list is None:
+            self._videos_list = list(self._videos.values())
+        return self._videos_list
 
-    def download_video(self, video: TgVideo) -> Optional[int]:
-        for i in range(2, 33):
-            if i not in self._loading:
-                break
-        else:
+    async def download_video(self, video: TgVideo) -> Optional[int]:
+        if not self._free_priorities:
             return
 
+        i = heapq.heappop(self._free_priorities)
         self._loading[i] = video
-        self._call('downloadFile', file_id=video.file_id, priority=i)
+        self._loading_by_file_id[video.file_id] = i
+        await self._call('downloadFile', file_id=video.file_id, priority=i)
         return i
 
     def _remove_from_queue(self, video):
-        for k, v in self._loading.items():
-            if v == video:
-                self._loading.pop(k)
-                break
+        k = self._loading_by_file_id.pop(video.file_id, None)
+        if k is not None:
+            self._loading.pop(k)
+            heapq.heappush(self._free_priorities, k)
 
-    def cancel_download_video(self, video: TgVideo) -> None:
+    async def cancel_download_video(self, video: TgVideo) -> None:
         self._remove_from_queue(video)
-        self._call('cancelDownloadFile', file_id=video.file_id)
-
-    def delete_video(self, video: TgVideo) -> None:
-        self._call('deleteFile', file_id=video.file_id)
-
-    def delete_message(self, video: TgVideo) -> None:
-        ids = [video.message_id]
-        if video.album:
-            ids.extend(video.album)
-        self._call('deleteMessages', chat_id=chat_id, message_ids=ids)
-        self._videos.pop(video.file_id)
+        await self._call('cancelDownloadFile', file_id=video.file_id)
+
+    async def delete_video(self, video: TgVideo) -> None:
+        await self._call('deleteFile', file_id=video.file_id)
+
+    async def delete_files_bulk(self, videos: list[TgVideo]) -> None:
+        await asyncio.gather(*(self.delete_video(video) for video in videos))
+
+    async def delete_messages_bulk(self, videos: list[TgVideo]) -> None:
+        ids = []
+        for video in videos:
+            ids.append(video.message_id)
+            if video.album:
+                ids.extend(video.album)
+        await self._call('deleteMessages', chat_id=chat_id, message_ids=ids)
+        for video in videos:
+            self._videos.pop(video.file_id, None)
+        self._videos_list = None
+        self._gen += 1
 
 
 if __name__ == '__main__':
@@ -7,7 +7,6 @@ from pathlib import Path
 
 from rich import box
 from rich.panel import Panel
-from rich.pretty import Pretty
 from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn, SpinnerColumn, ProgressColumn
 from rich.table import Table, Column
 from rich.text import Text
@@ -23,14 +22,22 @@ from textual.widget import Widget, Reactive
 from .tg import TgClient, TgException, TgVideo
 
 
-CURSOR_LEFT = ':point_right:'
-CURSOR_RIGHT = ':point_left:'
-CURSOR = ':point_right:'
+# pre-parsed, so emoji markup is not processed on every render
+CURSOR_LEFT = Text.from_markup(':point_right:')
+CURSOR_RIGHT = Text.from_markup(':point_left:')
+CURSOR = CURSOR_LEFT
+BLANK = Text('')
 FOCUSED_STYLE = 'green'
 UNFOCUSED_STYLE = 'white'
 
-RUNNING = ':green_circle:'
-STOPPED = ':red_circle:'
+RUNNING = Text.from_markup(':green_circle:')
+STOPPED = Text.from_markup(':red_circle:')
+CHECKED = Text.from_markup(':white_check_mark:')
+UNCHECKED = Text.from_markup(':cross_mark:')
+
+# history loaded on startup: INITIAL_PAGES pages of PAGE_SIZE messages
+INITIAL_PAGES = 10
+PAGE_SIZE = 100
 
 
 class VideoSelected(Message):
@@ -166,10 +173,22 @@ class ScrollableListMixin:
 
 class ShortDownload(ProgressColumn):
     def render(self, task):
-        mb = 1024 * 1024
-        completed = task.completed // mb
-        total = task.total // mb
-        return Text(f'{completed}/{total}', style='progress.download')
+        key = (int(task.completed) >> 20, int(task.total) >> 20)
+        if task.fields.get('_mb_key') == key:
+            return task.fields['_mb_text']
+
+        text = Text(f'{key[0]}/{key[1]}', style='progress.download')
+        task.fields['_mb_key'], task.fields['_mb_text'] = key, text
+        return text
+
+
+class FieldColumn(ProgressColumn):
+    def __init__(self, field, table_column=None):
+        super().__init__(table_column=table_column)
+        self.field = field
+
+    def render(self, task):
+        return task.fields[self.field]
 
 
 class DownloadList(FocusableMixin, ScrollableListMixin, Widget):
@@ -180,20 +199,23 @@ class DownloadList(FocusableMixin, ScrollableListMixin, Widget):
         tg.add_download_callback(self._video_updated)
 
         self.progress = Progress(
-          TextColumn('{task.fields[focus_left]}',
-                     table_column=Column(width=2)),
-          TextColumn('{task.fields[state]}',
-                     table_column=Column(width=2)),
+          FieldColumn('focus_left',
+                      table_column=Column(width=2)),
+          FieldColumn('state',
+                      table_column=Column(width=2)),
           SpinnerColumn(),
           TextColumn('{task.description:.7}',
                      table_column=Column(no_wrap=True)),
           BarColumn(bar_width=8),
           ShortDownload(), # 9
           TransferSpeedColumn(),  # 10
-          TextColumn('{task.fields[focus_right]}',
-                     table_column=Column(width=2)),
+          FieldColumn('focus_right',
+                      table_column=Column(width=2)),
           expand=True,
         )
+        self._tasks_by_id = {}
+        self._tasks_by_video_id = {}
+        self._dirty_videos = {}
 
     def __del__(self):
         self.tg.remove_download_callback(self._video_updated)
@@ -207,38 +229,49 @@ class DownloadList(FocusableMixin, ScrollableListMixin, Widget):
         return self.progress.task_ids
 
     def _find_task_by_id(self, id_):
-        for task in self.progress.tasks:
-            if task.id == id_:
-                return task
+        return self._tasks_by_id.get(id_)
 
     def _find_task_by_video(self, video):
-        for task in self.progress.tasks:
-            if task.fields['video'] == video:
-                return task
+        return self._tasks_by_video_id.get(video.file_id)
+
+    def _remove_task(self, task):
+        self._tasks_by_id.pop(task.id, None)
+        self._tasks_by_video_id.pop(task.fields['video'].file_id, None)
+        self.progress.remove_task(task.id)
 
     async def _start_task(self, task):
-        self.tg.download_video(task.fields['video'])
+        await self.tg.download_video(task.fields['video'])
         self.progress.start_task(task.id)
         self.progress.update(task.id, running=True)
 
     async def _stop_task(self, task):
-        self.tg.cancel_download_video(task.fields['video'])
+        await self.tg.cancel_download_video(task.fields['video'])
         self.progress.stop_task(task.id)
         self.progress.update(task.id, running=False)
 
     def _video_updated(self, video):
-        task = self._find_task_by_video(video)
-        if not task:
-            return
-        self.progress.update(task.id, completed=video.downloaded_size)
+        # called from the tdlib thread for every chunk, applied in batch by _check
+        self._dirty_videos[video.file_id] = video
 
     async def _check(self):
-        for task in self.progress.tasks[:]:
-            video = task.fields['video']
+        if not self._dirty_videos:
+            return
+
+        completed = []
+        while self._dirty_videos:
+            _, video = self._dirty_videos.popitem()
+            task = self._find_task_by_video(video)
+            if not task:
+                continue
+            self.progress.update(task.id, completed=video.downloaded_size)
             if video.completed:
-                await self.emit(VideoDownloaded(self, task.fields['video']))
-                self.progress.remove_task(task.id)
-                self._scroll(0)
+                completed.append(task)
+
+        for task in completed:
+            await self.emit(VideoDownloaded(self, task.fields['video']))
+            self._remove_task(task)
+        if completed:
+            self._scroll(0)
 
         self.refresh()
 
@@ -247,19 +280,19 @@ class DownloadList(FocusableMixin, ScrollableListMixin, Widget):
 
         for video in self.tg.videos:
             if video.downloaded_size:
-                self.add_video(video, start=False)
+                await self.add_video(video, start=False)
 
     def render(self):
-        for task in self.progress.tasks:
+        tasks = self.progress.tasks[self.render_offset:self.render_offset+self.available_height]
+        for task in tasks:
             if task.id == self.focused_item:
                 focus = (CURSOR_LEFT, CURSOR_RIGHT)
             else:
-                focus = ('', '')
+                focus = (BLANK, BLANK)
             task.fields['focus_left'], task.fields['focus_right'] = focus
             task.fields['state'] = RUNNING if task.fields['running'] else STOPPED
-            # todo: scroll
         return Panel(
-            self.progress,
+            self.progress.make_tasks_table(tasks),
             title=f'downloads ({len(self.progress.task_ids)})',
             border_style=FOCUSED_STYLE if self.has_focus else UNFOCUSED_STYLE,
         )
@@ -289,8 +322,8 @@ class DownloadList(FocusableMixin, ScrollableListMixin, Widget):
     async def key_d(self, event):
         task = self._find_task_by_id(self.focused_item)
         video = task.fields['video']
-        self.tg.delete_video(video)
-        self.progress.remove_task(task.id)
+        await self.tg.delete_video(video)
+        self._remove_task(task)
         self._scroll(0)
         self.refresh()
 
@@ -304,24 +337,30 @@ class DownloadList(FocusableMixin, ScrollableListMixin, Widget):
 
     async def handle_video_selected(self, event):
         video = event.video
-        self.add_video(video)
+        await self.add_video(video)
 
-    def add_video(self, video, start=True):
+    async def add_video(self, video, start=True):
         task = self._find_task_by_video(video)
         if task:
             return
 
-        self.progress.add_task(
-            video.caption.splitlines()[0] if video.caption else '',
+        task_id = self.progress.add_task(
+            video.short_caption,
             total=video.expected_size,
             completed=video.downloaded_size,
             start=start,
             video=video,
             running=start,
         )
+        task = self.progress._tasks[task_id]
+        self._tasks_by_id[task_id] = task
+        self._tasks_by_video_id[video.file_id] = task
+        if video.completed:
+            # let the next _check report it
+            self._dirty_videos[video.file_id] = video
 
         if start:
-            self.tg.download_video(video)
+            await self.tg.download_video(video)
 
     async def watch_focused_index(self, value):
         if value is None:
@@ -337,10 +376,21 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
         super().__init__()
         self.tg = tg
         self.video_filter = lambda v: True
-
-    def render(self):
-        cap_w = self.size.width - 6 - 6 - 2 - 2 - 4*2 - 2*2 - 2
-        t = Table(
+        self._filtered_cache = None
+        self._filtered_gen = None
+        self._table = None
+        self._table_width = None
+
+    def _get_table(self):
+        width = self.size.width
+        if self._table is not None and self._table_width == width:
+            self._table.rows.clear()
+            for column in self._table.columns:
+                column._cells.clear()
+            return self._table
+
+        cap_w = width - 6 - 6 - 2 - 2 - 4*2 - 2*2 - 2
+        self._table = Table(
             Column('', width=2),
             Column('caption', width=cap_w, no_wrap=True),
             Column(':arrow_up:  dur', width=6, justify='right'),
@@ -348,25 +398,27 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
             Column('', width=2),
             box=None,
         )
+        self._table_width = width
+        return self._table
 
+    def render(self):
+        t = self._get_table()
         for v in self.items[self.render_offset:self.render_offset+self.available_height]:
-            caption = v.caption.splitlines()[0] if v.caption else ''
+            caption = v.short_caption
             color = ''
             if v.completed:
                 color = '[green]'
             elif v.downloaded_size:
                 color = '[yellow]'
-            duration = f'{int(v.duration/60):02}:{v.duration%60:02}'
-            size = f'{int(v.expected_size / 1024**2)}mb'
-            l, r = (CURSOR_LEFT, CURSOR_RIGHT) if v is self.focused_item else ('', '')
-            t.add_row(l, color + caption, color + duration, color + size, r)
+            l, r = (CURSOR_LEFT, CURSOR_RIGHT) if v is self.focused_item else (BLANK, BLANK)
+            t.add_row(l, color + caption, color + v.duration_str, color + v.size_str, r)
 
         suffix = ''
         if self.focused_item:
             suffix = f' / {self.focused_index + 1}'
         return Panel(
             t,
-            title=f'videos ({len(self.tg.videos)} / {len(self.items)}{suffix})',
+            title=f'videos ({len(self.tg)} / {len(self.items)}{suffix})',
             border_style=FOCUSED_STYLE if self.has_focus else UNFOCUSED_STYLE,
         )
 
@@ -376,7 +428,10 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
 
     @property
     def items(self):
-        return [v for v in self.tg.videos if self.video_filter(v)]
+        if self._filtered_cache is None or self._filtered_gen != self.tg.generation:
+            self._filtered_cache = [v for v in self.tg.iter_videos() if self.video_filter(v)]
+            self._filtered_gen = self.tg.generation
+        return self._filtered_cache
 
     async def on_key(self, event):
         await self.dispatch_key(event)
@@ -390,11 +445,10 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
         item = self.focused_item
         await self._delete(item)
 
-    async def _delete(self, item):
+    async def _delete(self, *items):
         # todo
-        # if not item.completed:
-        #     self.tg.delete_video(item)
-        self.tg.delete_message(item)
+        # await self.tg.delete_files_bulk([item for item in items if not item.completed])
+        await self.tg.delete_messages_bulk(list(items))
         self._scroll(0)
         self.refresh()
 
@@ -412,11 +466,11 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
 
     async def key_r(self, event):
         # self.tg.reset()
-        self.tg.list_videos()
+        await self.tg.list_videos()
         self.refresh()
 
     async def key_n(self, event):
-        self.tg.load_next()
+        await self.tg.load_next()
         self.refresh()
 
     async def key_s(self, event):
@@ -427,6 +481,7 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
 
     async def handle_filter_changed(self, event):
         self.video_filter = event.video_filter
+        self._filtered_cache = None
         self.refresh()
 
     async def handle_video_downloaded(self, event):
@@ -436,13 +491,26 @@ class VideoList(FocusableMixin, ScrollableListMixin, Widget):
 class VideoInfo(Widget):
     video = None
 
+    @staticmethod
+    def _summary(video):
+        # no download progress here: the panel only re-renders when the pointed video changes
+        return '\n'.join((
+            f'caption: {video.caption or ""}',
+            f'duration: {video.duration_str}',
+            f'size: {video.size_str}',
+            f'file_id: {video.file_id}',
+            f'path: {video.local_path or "-"}',
+        ))
+
     def render(self):
         return Panel(
-            Pretty(self.video) if self.video else '',
+            Text(self._summary(self.video)) if self.video else '',
             title='info',
         )
 
     async def handle_video_pointed(self, event):
+        if event.video is self.video:
+            return
         self.video = event.video
         self.refresh()
 
@@ -546,8 +614,8 @@ class VideoFilter(ScrollableListMixin, Widget):
             box=None,
         )
         for name, attrs in self.filters.items():
-            l, r = (CURSOR_LEFT, CURSOR_RIGHT) if self.focused_item == name else ('', '')
-            check = ':white_check_mark:' if attrs[0] else ':cross_mark:'
+            l, r = (CURSOR_LEFT, CURSOR_RIGHT) if self.focused_item == name else (BLANK, BLANK)
+            check = CHECKED if attrs[0] else UNCHECKED
             t.add_row(l, name, check, attrs[1] + ' ' + attrs[2], r)
 
         return Panel(
@@ -584,9 +652,8 @@ class MyApp(App):
         )
 
         tg = TgClient()
-        # todo: in bg
-        tg.init()
-        tg.list_videos()
+        await tg.init()
+        await tg.list_videos(PAGE_SIZE)
 
         self.download_list = DownloadList(tg)
         self.video_list = VideoList(tg)
@@ -608,6 +675,20 @@ class MyApp(App):
         await self.second_page.dock(self.video_filter)
         await self.view.dock(self.second_page)
 
+        self._loader = asyncio.ensure_future(self._load_videos(tg))
+        self._loader.add_done_callback(self._loader_done)
+
+    async def _load_videos(self, tg):
+        # the first page is already loaded by on_mount
+        for _ in range(INITIAL_PAGES - 1):
+            if not await tg.load_next(PAGE_SIZE):
+                break
+            self.video_list.refresh()
+
+    def _loader_done(self, task):
+        if not task.cancelled() and task.exception():
+            self.log(f'cant load videos: {task.exception()!r}')
+
     async def action_next_tab(self):
         if not self.main_page.visible:
             return